@@ -32,245 +32,432 @@ Notes:
 - Only jobs with a typed GPU in TRES (keys like "gres/gpu:a30", "gres/gpu:a40", "gres/gpu:a100") are included.
 - Jobs without a typed GPU are skipped (can be enabled via flag in the future).
  - Use the `--last` flag to only include the latest timestamp block without parsing the entire file.
+ - Use `--jobs N` (0 for one per CPU) to parse large files with N worker processes.
 """
 
 from __future__ import annotations
 
 import argparse
+import contextlib
+import functools
+import itertools
 import json
+import mmap
+import multiprocessing
 import re
 import os
-from datetime import datetime
-from typing import Dict, Any, Optional
+import stat
+import sys
+import tempfile
+from typing import Dict, Any, BinaryIO, Iterable, Iterator, List, Optional, Tuple
 
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used when orjson is missing
+    orjson = None
 
-TIMESTAMP_FORMAT = "%a %b %d %H:%M:%S %Y"  # e.g., Thu Dec 18 04:37:01 2025
 
+# Timestamp lines look like `date` output, e.g. "Thu Dec 18 04:37:01 2025".
+# The day of month may be space-padded ("Thu Dec  4 ..."). The raw string is
+# stored verbatim, so checking the names and shape is enough; no datetime
+# parsing needed. Names are the C-locale ones `date` and strptime use.
+_WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+_TS_PATTERN = rf"(?:{'|'.join(_WEEKDAYS)}) (?:{'|'.join(_MONTHS)}) [ 0-9]\d \d\d:\d\d:\d\d \d{{4}}"
 
-def is_timestamp_line(line: str) -> Optional[str]:
-    """Return normalized timestamp string if line is a timestamp, else None.
 
-    Keeps the raw line by default; if parseable, returns the raw trimmed string.
+# Record lines have columns: JOBID USER TRES_ALLOC NODELIST STATE
+# NODELIST may be empty for PENDING jobs, so its column is optional and the
+# group is None when absent. Every column is a single whitespace-free token,
+# which leaves the engine nothing to backtrack over: matching stays linear in
+# the line length even for malformed lines.
+_RECORD_PATTERN = (
+    r"(?P<jobid>\d+)\s+"               # JOBID
+    r"(?P<user>\S+)\s+"                # USER
+    r"(?P<tres>\S+)\s+"                # TRES_ALLOC
+    r"(?:(?P<nodelist>\S+)\s+)?"       # NODELIST (may be empty)
+    r"(?P<state>[A-Z]+)"                # STATE
+)
+# Bytes pattern, like the others below: lines are matched straight from the
+# mmap and only the captured fields are decoded.
+RECORD_RE = re.compile(rf"^\s*{_RECORD_PATTERN}\s*$".encode('ascii'))
+
+# Classifies a whole line in one pass. Exactly one of the `ts`, `header` or
+# record alternatives matches; `m.lastgroup` tells which ('ts', 'header', or
+# 'state' for a record). Blank and unrecognized lines do not match.
+_LINE_RE = re.compile(
+    rf"^\s*(?:(?P<ts>{_TS_PATTERN})|(?P<header>JOBID\s+USER.*)|{_RECORD_PATTERN})\s*$".encode('ascii')
+)
+# A whole (stripped) timestamp line, for scans that look at one line at a time
+_TS_RE_BYTES = re.compile(rf"^{_TS_PATTERN}$".encode('ascii'))
+
+# Timestamp-only variant of `_LINE_RE`. Lines are sorted by their first bytes
+# (see `iter_usage_blocks`): records start with a digit and go to RECORD_RE,
+# timestamps start with "<weekday> <month>".
+_TS_LINE_RE = re.compile(rf"(?P<ts>{_TS_PATTERN})\s*$".encode('ascii'))
+# The 84 valid 7-byte timestamp prefixes ("Thu Dec"); one set lookup rules
+# out nearly every other line before the timestamp regex runs.
+_TS_PREFIXES = frozenset(f"{wd} {mo}".encode('ascii') for wd in _WEEKDAYS for mo in _MONTHS)
+
+
+# A typed GPU entry of a TRES_ALLOC string, e.g. "gres/gpu:a40=4" -> ("a40", "4")
+_GPU_RE = re.compile(r"(?:^|,)gres/gpu:([^=,]+)=([^,]*)")
+
+
+def _tres_field(tres: str, key: str) -> Optional[str]:
+    """Return the value for `key` (given with its trailing '=') in a
+    comma-separated TRES string, or None if the key is absent.
     """
-    s = line.strip()
-    if not s:
+    i = tres.find(key)
+    # Only accept matches at the start of a pair ("mem=" must not hit "vmem=")
+    while i > 0 and tres[i - 1] != ',':
+        i = tres.find(key, i + 1)
+    if i < 0:
         return None
-    try:
-        # Validate it matches expected format; we still return raw string
-        datetime.strptime(s, TIMESTAMP_FORMAT)
-        return s
-    except ValueError:
+    i += len(key)
+    j = tres.find(',', i)
+    return tres[i:j] if j >= 0 else tres[i:]
+
+
+@functools.lru_cache(maxsize=8192)
+def _parse_tres(raw: bytes) -> Optional[Tuple[Any, ...]]:
+    """Parse a raw TRES_ALLOC column into `(cpu, mem, node, billing, gpus)`.
+
+    `gpus` holds `(gpu_type, gpu_number)` pairs; returns None when the TRES
+    has no typed GPU entry. A running job repeats the same TRES in every
+    block, so results are cached by the raw bytes.
+    """
+    tres = raw.decode('utf-8', errors='ignore')
+
+    # Identify typed GPU entries: keys like 'gres/gpu:a40'
+    gpus = tuple((sys.intern(gpu_type), _to_int(gpu_val)) for gpu_type, gpu_val in _GPU_RE.findall(tres))
+    if not gpus:
         return None
 
+    mem = _tres_field(tres, 'mem=')
+    return (
+        _to_int(_tres_field(tres, 'cpu=')),
+        sys.intern(mem) if mem is not None else None,
+        _to_int(_tres_field(tres, 'node=')),
+        _to_int(_tres_field(tres, 'billing=')),
+        gpus,
+    )
 
-# Record lines have columns: JOBID USER TRES_ALLOC NODELIST STATE
-# NODELIST may be empty for PENDING jobs; capture it as optional non-whitespace.
-RECORD_RE = re.compile(
-    r"^\s*(?P<jobid>\d+)\s+"  # JOBID
-    r"(?P<user>\S+)\s+"        # USER
-    r"(?P<tres>.*?)\s+"         # TRES_ALLOC (greedy up to next column)
-    r"(?P<nodelist>\S*)\s+"     # NODELIST (may be empty)
-    r"(?P<state>[A-Z]+)\s*$"     # STATE
-)
 
+def _decode_into(cache: Dict[bytes, str], raw: bytes) -> str:
+    """Decode (dropping invalid UTF-8) and intern `raw`, caching it in `cache`."""
+    text = cache[raw] = sys.intern(raw.decode('utf-8', errors='ignore'))
+    return text
 
-def parse_tres_alloc(tres: str) -> Dict[str, str]:
-    """Parse comma-separated TRES key=value pairs into a dict of strings."""
-    result: Dict[str, str] = {}
-    for part in tres.split(','):
-        part = part.strip()
-        if not part:
-            continue
-        if '=' not in part:
-            # Ignore malformed pieces
-            continue
-        key, value = part.split('=', 1)
-        result[key.strip()] = value.strip()
-    return result
 
+def _iter_lines(buf, start: int = 0, end: Optional[int] = None):
+    """Yield the bytes lines of `buf[start:end]`, without newlines."""
+    if end is None:
+        end = len(buf)
+    while start < end:
+        nl = buf.find(b'\n', start, end)
+        if nl < 0:
+            nl = end
+        yield buf[start:nl]
+        start = nl + 1
 
-def ensure_nested(d: Dict[str, Any], *keys: str) -> Dict[str, Any]:
-    """Ensure nested dicts exist for keys and return the deepest dict."""
-    cur = d
-    for k in keys:
-        if k not in cur or not isinstance(cur[k], dict):
-            cur[k] = {}
-        cur = cur[k]  # type: ignore[index]
-    return cur
 
+# Below this size a process pool costs more to start than it saves
+_PARALLEL_MIN_BYTES = 8 * 1024 * 1024
 
-def parse_usage_file(path: str) -> Dict[str, Any]:
-    """Parse the usage file into the requested nested structure."""
-    data: Dict[str, Any] = {}
-    current_ts: Optional[str] = None
 
-    with open(path, 'r', encoding='utf-8') as f:
-        for raw_line in f:
-            line = raw_line.rstrip('\n')
+def iter_usage_file(path: str, jobs: int = 1) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield `(timestamp, block)` pairs from the usage file as they are parsed.
 
-            ts = is_timestamp_line(line)
-            if ts is not None:
-                current_ts = ts
-                ensure_nested(data, current_ts)
-                continue
+    The file is memory-mapped and scanned as bytes; see `iter_usage_blocks`.
+    Inputs that cannot be mapped (pipes, FIFOs) are read line by line. With
+    `jobs > 1`, large files are split on timestamp lines and the pieces are
+    parsed by a pool of worker processes; pairs still come out in file order.
+    """
+    with open(path, 'rb') as fb:
+        st = os.fstat(fb.fileno())
+        if stat.S_ISREG(st.st_mode) and st.st_size == 0:
+            return
+        try:
+            mm = mmap.mmap(fb.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Pipes, /dev/stdin and some filesystems cannot be mapped; read
+            # them as a plain stream of newline-terminated bytes lines
+            yield from iter_usage_blocks(fb)
+            return
+        with mm:
+            if jobs > 1 and len(mm) >= _PARALLEL_MIN_BYTES:
+                # Several pieces per worker keeps them all busy and bounds how
+                # much parsed data waits in the parent for its turn.
+                bounds = _block_boundaries(mm, jobs * 4)
+                tasks = [(path, start, end) for start, end in zip(bounds, bounds[1:])]
+                with multiprocessing.Pool(jobs) as pool:
+                    parsed = itertools.chain.from_iterable(pool.imap(_parse_range, tasks))
+                    yield from _fold_adjacent(parsed)
+                return
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            yield from iter_usage_blocks(_iter_lines(mm))
+
+
+def _block_boundaries(buf, parts: int) -> List[int]:
+    """Split `buf` into up to `parts` byte ranges that each start on a timestamp line.
+
+    Returns the sorted range offsets, starting at 0 and ending at `len(buf)`.
+    """
+    size = len(buf)
+    bounds = [0]
+    for i in range(1, parts):
+        # Walk forward from the target offset to the next timestamp line
+        pos = buf.find(b'\n', max(size * i // parts, bounds[-1]))
+        while pos >= 0:
+            start = pos + 1
+            pos = buf.find(b'\n', start)
+            if _TS_RE_BYTES.match(buf[start:pos if pos >= 0 else size].strip()):
+                break
+        else:
+            break
+        if start > bounds[-1]:
+            bounds.append(start)
+    bounds.append(size)
+    return bounds
+
+
+def _parse_range(task: Tuple[str, int, int]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Pool worker: parse the byte range `[start, end)` of the file at `path`."""
+    path, start, end = task
+    with open(path, 'rb') as fb:
+        with mmap.mmap(fb.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return list(iter_usage_blocks(_iter_lines(mm, start, end)))
 
-            sline = line.strip()
-            if not sline:
-                continue
-            if sline.startswith('JOBID'):
-                # Header line; skip
-                continue
 
-            # Record line
-            m = RECORD_RE.match(line)
-            if not m:
-                # Unrecognized line; skip
-                continue
+def _fold_adjacent(blocks: Iterable[Tuple[str, Dict[str, Any]]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Merge consecutive blocks that share a timestamp.
+
+    A timestamp repeated across a range boundary comes back from two workers;
+    this restores what a single pass over the file would have yielded.
+    """
+    prev_ts: Optional[str] = None
+    prev: Optional[Dict[str, Any]] = None
+    for ts, block in blocks:
+        if prev is not None and ts == prev_ts:
+            _merge_block(prev, block)
+            continue
+        if prev is not None:
+            yield prev_ts, prev
+        prev_ts, prev = ts, block
+    if prev is not None:
+        yield prev_ts, prev
 
-            if not current_ts:
-                # Safety: if a record appears before a timestamp, skip
-                continue
 
-            jobid = m.group('jobid')
-            user = m.group('user')
-            tres = m.group('tres').strip()
-            nodelist = m.group('nodelist').strip()
-            state = m.group('state').strip()
+def parse_usage_file(path: str, jobs: int = 1) -> Dict[str, Any]:
+    """Parse the usage file into the requested nested structure."""
+    return _collect_blocks(iter_usage_file(path, jobs))
 
-            tres_dict = parse_tres_alloc(tres)
 
-            # Identify typed GPU entries: keys like 'gres/gpu:a40'
-            typed_gpu_entries = [(k.split(':', 1)[1], v) for k, v in tres_dict.items() if k.startswith('gres/gpu:') and ':' in k]
-            if not typed_gpu_entries:
-                # Skip jobs without a typed GPU
-                continue
+def parse_usage_lines(lines) -> Dict[str, Any]:
+    """Parse an iterable of bytes lines into the nested structure."""
+    return _collect_blocks(iter_usage_blocks(lines))
 
-            # Use parsed CPU, MEM, NODE, BILLING values if present
-            cpu = _safe_int(tres_dict.get('cpu'))
-            mem = tres_dict.get('mem')
-            node = _safe_int(tres_dict.get('node'))
-            billing = _safe_int(tres_dict.get('billing'))
-
-            # For each typed GPU entry, add a job record under that gpu_type
-            for gpu_type, gpu_val in typed_gpu_entries:
-                gpu_number = _safe_int(gpu_val)
-                leaf = ensure_nested(data, current_ts, user, gpu_type)
-                leaf[jobid] = {
-                    'gpu_number': gpu_number,
-                    'cpu': cpu,
-                    'mem': mem,
-                    'node': node,
-                    'billing': billing,
-                    'nodelist': (nodelist if nodelist else None),
-                    'state': state,
-                }
 
+def _collect_blocks(blocks: Iterable[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+    """Build the full nested dict, merging blocks that share a timestamp."""
+    data: Dict[str, Any] = {}
+    for ts, block in blocks:
+        prev = data.get(ts)
+        if prev is None:
+            data[ts] = block
+        else:
+            _merge_block(prev, block)
     return data
 
 
-def parse_usage_lines(lines) -> Dict[str, Any]:
-    """Parse an iterable of lines into the nested structure.
+def _merge_block(dst: Dict[str, Any], src: Dict[str, Any]) -> None:
+    """Merge the jobs of timestamp block `src` into `dst`."""
+    for user, gpu_types in src.items():
+        for gpu_type, jobs in gpu_types.items():
+            dst.setdefault(user, {}).setdefault(gpu_type, {}).update(jobs)
+
+
+def iter_usage_blocks(lines) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Parse an iterable of bytes lines, yielding one `(timestamp, block)` pair
+    per timestamp block.
 
-    This mirrors `parse_usage_file` but consumes provided lines.
+    Lines are dispatched on their leading bytes to a single pattern (see the
+    loop below). Consecutive repeats of the same timestamp are folded into one
+    block; a timestamp that reappears later yields a separate pair.
     """
-    data: Dict[str, Any] = {}
     current_ts: Optional[str] = None
+    # Sub-dict of the timestamp block currently being filled
+    ts_dict: Optional[Dict[str, Any]] = None
+
+    # Local aliases keep global/attribute lookups out of the per-line loop
+    line_match = _LINE_RE.match
+    record_match = RECORD_RE.match
+    ts_match = _TS_LINE_RE.match
+    ts_prefixes = _TS_PREFIXES
+    parse_tres = _parse_tres
+    # Decoded, interned text for raw field bytes. Jobs, users, nodes and
+    # states repeat in every block a job is listed in, so most fields are a
+    # single dict hit instead of a decode plus intern.
+    text: Dict[bytes, str] = {}
+    text_get = text.get
 
     for raw_line in lines:
-        line = raw_line.rstrip('\n')
-
-        ts = is_timestamp_line(line)
-        if ts is not None:
-            current_ts = ts
-            ensure_nested(data, current_ts)
-            continue
-
-        sline = line.strip()
-        if not sline:
+        # Dispatch on the leading bytes so each line is tried against one
+        # pattern only. Header lines ('JOBID ...') need no regex at all;
+        # blank or indented lines fall back to the full classifier.
+        c = raw_line[:1]
+        if c.isdigit():
+            if b'gres/gpu:' not in raw_line:
+                # Jobs without a typed GPU are dropped anyway; a substring
+                # search rejects them without running the record regex.
+                continue
+            m = record_match(raw_line)
+            kind = 'state'
+        elif raw_line[:7] in ts_prefixes:
+            m = ts_match(raw_line)
+            kind = 'ts'
+        elif c.isalpha():
+            # Headers, and lines that cannot be a timestamp or a record
             continue
-        if sline.startswith('JOBID'):
+        else:
+            m = line_match(raw_line)
+            kind = m.lastgroup if m else None
+        if not m:
             continue
 
-        m = RECORD_RE.match(line)
-        if not m:
+        if kind == 'ts':
+            ts = m.group('ts').decode('utf-8')
+            if ts != current_ts:
+                if ts_dict is not None:
+                    yield current_ts, ts_dict
+                current_ts, ts_dict = ts, {}
             continue
-        if not current_ts:
+        if kind == 'header':
             continue
 
-        jobid = m.group('jobid')
-        user = m.group('user')
-        tres = m.group('tres').strip()
-        nodelist = m.group('nodelist').strip()
-        state = m.group('state').strip()
-
-        tres_dict = parse_tres_alloc(tres)
-        typed_gpu_entries = [(k.split(':', 1)[1], v) for k, v in tres_dict.items() if k.startswith('gres/gpu:') and ':' in k]
-        if not typed_gpu_entries:
+        if ts_dict is None:
+            # Safety: if a record appears before a timestamp, skip
             continue
 
-        cpu = _safe_int(tres_dict.get('cpu'))
-        mem = tres_dict.get('mem')
-        node = _safe_int(tres_dict.get('node'))
-        billing = _safe_int(tres_dict.get('billing'))
-
-        for gpu_type, gpu_val in typed_gpu_entries:
-            gpu_number = _safe_int(gpu_val)
-            leaf = ensure_nested(data, current_ts, user, gpu_type)
+        tres = parse_tres(m.group('tres'))
+        if tres is None:
+            # Skip jobs without a typed GPU
+            continue
+        cpu, mem, node, billing, typed_gpu_entries = tres
+
+        jobid, user, nodelist, state = m.group('jobid', 'user', 'nodelist', 'state')
+        jobid = text_get(jobid) or _decode_into(text, jobid)
+        user = text_get(user) or _decode_into(text, user)
+        if nodelist is not None:
+            nodelist = text_get(nodelist) or _decode_into(text, nodelist)
+        state = text_get(state) or _decode_into(text, state)
+
+        user_dict = ts_dict.get(user)
+        if user_dict is None:
+            user_dict = ts_dict[user] = {}
+
+        # For each typed GPU entry, add a job record under that gpu_type
+        for gpu_type, gpu_number in typed_gpu_entries:
+            leaf = user_dict.get(gpu_type)
+            if leaf is None:
+                leaf = user_dict[gpu_type] = {}
             leaf[jobid] = {
                 'gpu_number': gpu_number,
                 'cpu': cpu,
                 'mem': mem,
                 'node': node,
                 'billing': billing,
-                'nodelist': (nodelist if nodelist else None),
+                'nodelist': nodelist,
                 'state': state,
             }
 
-    return data
+    if ts_dict is not None:
+        yield current_ts, ts_dict
 
 
 def parse_last_usage_file(path: str) -> Dict[str, Any]:
     """Parse only the latest timestamp block from the file efficiently.
 
     Strategy:
-    - Read a chunk from the end of the file (increasing sizes if needed).
-    - Find the last timestamp line within that tail chunk.
+    - Memory-map the file and walk backward from the end, one newline at a time.
+    - Stop at the first line that looks like a timestamp.
     - Parse lines starting at that timestamp to the file end.
-    """
-    filesize = os.path.getsize(path)
-    if filesize == 0:
-        return {}
-
-    # Progressive tail sizes (4MB → 16MB → 64MB → full file)
-    tail_sizes = [4 * 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024, filesize]
 
+    Files that cannot be memory-mapped are read backward in small chunks
+    instead (see `_last_timestamp_offset`); pipes are parsed front to back.
+    """
     with open(path, 'rb') as fb:
-        for tail in tail_sizes:
-            start = max(0, filesize - tail)
-            fb.seek(start)
-            data = fb.read(filesize - start)
-            try:
-                text = data.decode('utf-8')
-            except UnicodeDecodeError:
-                # Fallback to ignoring decode errors
-                text = data.decode('utf-8', errors='ignore')
-
-            lines = text.splitlines()
-            last_ts_idx: Optional[int] = None
-            # Walk from end to find the last timestamp line within this chunk
-            for i in range(len(lines) - 1, -1, -1):
-                ts = is_timestamp_line(lines[i])
-                if ts is not None:
-                    last_ts_idx = i
-                    break
-
-            if last_ts_idx is not None:
-                # Parse from the found timestamp to the end of the file
-                tail_lines = lines[last_ts_idx:]
-                return parse_usage_lines(tail_lines)
-
-    # Fallback: parse entire file (should rarely happen)
-    return parse_usage_file(path)
+        st = os.fstat(fb.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            # Pipes cannot be read backward; parse forward and keep the last block
+            last = None
+            for last in iter_usage_blocks(fb):
+                pass
+            return dict([last]) if last is not None else {}
+        size = st.st_size
+        if size == 0:
+            return {}
+        try:
+            mm = mmap.mmap(fb.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Some filesystems and special files do not support mmap
+            offset = _last_timestamp_offset(fb, size)
+            if offset is None:
+                return {}
+            fb.seek(offset)
+            return parse_usage_lines(fb)
+        with mm:
+            pos = len(mm)
+            while pos > 0:
+                nl = mm.rfind(b'\n', 0, pos)
+                if _TS_RE_BYTES.match(mm[nl + 1:pos].strip()):
+                    return parse_usage_lines(_iter_lines(mm, nl + 1))
+                pos = nl
+
+    # No timestamp anywhere in the file, so there is no block to report
+    return {}
+
+
+# Read size for the backward scan in `_last_timestamp_offset`
+_TAIL_CHUNK = 64 * 1024
+
+
+def _last_timestamp_offset(fb: BinaryIO, size: int) -> Optional[int]:
+    """Return the file offset of the last timestamp line, or None.
+
+    Reads backward from the end in `_TAIL_CHUNK` pieces, so I/O is bounded
+    by the distance to the last timestamp and no byte is read twice. A line
+    cut by a chunk boundary is carried over and completed by the next read.
+    """
+    pos = size
+    carry = b''
+    while pos > 0:
+        step = min(_TAIL_CHUNK, pos)
+        pos -= step
+        fb.seek(pos)
+        buf = fb.read(step) + carry
+        end = len(buf)
+        while True:
+            nl = buf.rfind(b'\n', 0, end)
+            if nl < 0 and pos > 0:
+                # Start of this line lies in the previous chunk
+                break
+            if _TS_RE_BYTES.match(buf[nl + 1:end].strip()):
+                return pos + nl + 1
+            if nl < 0:
+                break
+            end = nl
+        carry = buf[:end]
+    return None
+
+
+def _to_int(val: Optional[str]) -> Optional[int]:
+    """`_safe_int` with a fast path for plain digit strings."""
+    if val is not None and val.isdecimal():
+        return int(val)
+    return _safe_int(val)
 
 
 def _safe_int(val: Optional[str]) -> Optional[int]:
@@ -289,20 +476,122 @@ def _safe_int(val: Optional[str]) -> Optional[int]:
         return None
 
 
+def _dump_json(obj: Any, indent: int) -> bytes:
+    """Serialize `obj` like `json.dumps(obj, indent=indent, ensure_ascii=False)`, as UTF-8."""
+    if orjson is not None and indent == 2:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=indent, ensure_ascii=False).encode('utf-8')
+
+
+def write_json_blocks(blocks: Iterable[Tuple[str, Dict[str, Any]]], out: BinaryIO, indent: int = 2) -> None:
+    """Write `(timestamp, block)` pairs as one UTF-8 JSON object, one block at a time.
+
+    The output matches `json.dump(dict(blocks), out, indent=indent)` without
+    ever holding more than one block in memory. Blocks are serialized with
+    orjson when it is installed and `indent` is 2 (the only indent it supports).
+    """
+    pad = b'\n' + b' ' * indent
+    sep = b'{' + pad
+    for ts, block in blocks:
+        out.write(sep)
+        out.write(json.dumps(ts, ensure_ascii=False).encode('utf-8'))
+        out.write(b': ')
+        # Shift the block's own lines one level deeper
+        out.write(_dump_json(block, indent).replace(b'\n', pad))
+        sep = b',' + pad
+    out.write(b'{}' if sep[:1] == b'{' else b'\n}')
+
+
+class _RepeatedTimestamp(Exception):
+    """A timestamp block reappeared after other blocks had been written."""
+
+
+def _unique_blocks(blocks: Iterable[Tuple[str, Dict[str, Any]]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Pass blocks through, raising `_RepeatedTimestamp` on a timestamp seen before."""
+    seen = set()
+    for ts, block in blocks:
+        if ts in seen:
+            raise _RepeatedTimestamp(ts)
+        seen.add(ts)
+        yield ts, block
+
+
+def write_usage_json(path: str, out: BinaryIO, indent: int = 2, jobs: int = 1) -> None:
+    """Parse the usage file at `path` and write it to `out` as JSON.
+
+    Blocks are streamed one at a time. Timestamps carry no timezone, so a
+    DST fall-back hour repeats every minute; when a timestamp reappears the
+    output is rewritten from the merged dict (`parse_usage_file`) so it never
+    contains duplicate keys. Inputs or outputs that cannot be re-read or
+    rewound (pipes) use the merged dict from the start.
+    """
+    if not (stat.S_ISREG(os.stat(path).st_mode) and out.seekable()):
+        write_json_blocks(parse_usage_file(path, jobs).items(), out, indent)
+        return
+    try:
+        write_json_blocks(_unique_blocks(iter_usage_file(path, jobs)), out, indent)
+    except _RepeatedTimestamp:
+        out.seek(0)
+        out.truncate()
+        write_json_blocks(parse_usage_file(path, jobs).items(), out, indent)
+
+
+@contextlib.contextmanager
+def _replace_on_success(path: str) -> Iterator[BinaryIO]:
+    """Open `path` for writing so that it is only replaced if the block succeeds.
+
+    Output goes to a temporary file in the same directory, which is moved onto
+    `path` with `os.replace` once it is complete. A missing input or a parse
+    error therefore leaves the previous output intact instead of empty or
+    half written. Existing paths that are not regular files (/dev/stdout, a
+    FIFO) are written directly.
+    """
+    try:
+        direct = not stat.S_ISREG(os.stat(path).st_mode)
+    except FileNotFoundError:
+        direct = False
+    if direct:
+        with open(path, 'wb') as out:
+            yield out
+        return
+
+    fd, tmp = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            # mkstemp creates the file 0600; give it the mode open() would
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp, 0o666 & ~umask)
+            yield out
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Convert HPC usage text file to nested JSON by date, user, gpu_type, jobid.")
     parser.add_argument('--input', '-i', required=True, help='Path to uso_cluster.txt')
     parser.add_argument('--output', '-o', required=True, help='Path to write JSON output')
     parser.add_argument('--indent', type=int, default=2, help='JSON indentation (default: 2)')
     parser.add_argument('--last', action='store_true', help='Only include the latest timestamp block for faster processing')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Worker processes for parsing large files (0: one per CPU; default: 1)')
     args = parser.parse_args()
+    if args.jobs < 0:
+        parser.error('--jobs must be 0 (one per CPU) or a positive number')
+    jobs = args.jobs or (os.cpu_count() or 1)
 
     if args.last:
-        result = parse_last_usage_file(args.input)
+        # Parse before touching the output
+        last = parse_last_usage_file(args.input)
+        with _replace_on_success(args.output) as out:
+            write_json_blocks(last.items(), out, indent=args.indent)
     else:
-        result = parse_usage_file(args.input)
-    with open(args.output, 'w', encoding='utf-8') as out:
-        json.dump(result, out, indent=args.indent, ensure_ascii=False)
+        with _replace_on_success(args.output) as out:
+            write_usage_json(args.input, out, indent=args.indent, jobs=jobs)
 
 
 if __name__ == '__main__':